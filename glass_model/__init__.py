@@ -12,20 +12,29 @@ __author__ = "Jon Robinson"
 __copyright__ = "Copyright 2024, Jon Robinson. All rights reserved"
 __email__ = "jonrobinson1980@gmail.com"
 
-
-from icecream import ic
-
 # builtin modules
 import abc  # abstract module
-import itertools
 import json
-from typing import List
+import os
+import sys
+from typing import Callable, Dict, List, Tuple
 
 # local modules
 from glass_model import errors
 from glass_model import gstr
 from glass_model.gstr import Protocol
 
+# optional compiled parser, only there if built with Cython. See _parser.pyx
+try:
+    from glass_model import _parser
+except ImportError:
+    _parser = None
+
+
+# parsed buildups keyed by gstr, see GlassBuildup.make_glass
+_CACHE_MAX : int = 4096
+_GSTR_CACHE : Dict[str, 'GlassBuildup'] = {}
+
 
 class _BaseLayer(abc.ABC):
     """Base abstract class for ALL layers in a glass buildup
@@ -40,11 +49,30 @@ class _BaseLayer(abc.ABC):
     """
 
     THICKNESS_NOT_SET : float = 0
+    # whether layer counts towards buildup nominal thickness
+    CONTRIBUTES_TO_NOM_THICKNESS : bool = True
+
+    __slots__ = ('descriptor', '_t_nom', '_t_actual', '_gstr_cache', '__weakref__')
+    # slots copied by _clone, bar __weakref__. Recomputed for subclasses in __init_subclass__
+    _ALL_SLOTS : Tuple[str, ...] = __slots__[:-1]
+    # attributes serialized by GlassJsonEncoder
+    _JSON_FIELDS : Tuple[str, ...] = ('descriptor', '_t_nom', '_t_actual')
+    # canonical descriptor str objects, keyed by themselves. Seeded by subclasses
+    _DESCRIPTOR_INTERN : Dict[str, str] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every slot up the class hierarchy, for copying & serializing instances.
+        # __weakref__ is not copied, weak references belong to the original
+        cls._ALL_SLOTS = tuple(
+            name for c in reversed(cls.__mro__) for name in c.__dict__.get('__slots__', ())
+            if name != '__weakref__')
 
     def __init__(self, descriptor : str, t:float = THICKNESS_NOT_SET):
         self.descriptor = descriptor
         self._t_nom = t
         self._t_actual = t
+        self._gstr_cache = None
 
 
     @classmethod
@@ -54,18 +82,30 @@ class _BaseLayer(abc.ABC):
     ):
         g_str = g_str.strip() #ignroe all white space
 
-        thickness = gstr.find_first_number(g_str)
-        descriptor = g_str.split(str(thickness))[-1]
+        thickness, end = gstr.find_first_number_with_end(g_str)
+        return cls._init_from_fields(g_str[end:], thickness)
 
-        return cls(descriptor, thickness)
+    @classmethod
+    def _init_from_fields(cls, descriptor : str, t : float):
+        # share one str object per descriptor, rather than a new slice per layer
+        descriptor = cls._DESCRIPTOR_INTERN.get(descriptor) or sys.intern(descriptor)
+        return cls(descriptor, t)
 
-    def _to_json(self):
-        self.__dict__.update({'__meta__':False})
-        return self.__dict__
+    def _clone(self):
+        """Returns a copy of the layer, independent of the original"""
+        clone = self.__class__.__new__(self.__class__)
+        for name in self._ALL_SLOTS:
+            setattr(clone, name, getattr(self, name))
+        return clone
 
 
     def to_gstr(self, inc_meta = True):
-        return f'{self.t_nom}{self.descriptor}'
+        # only rebuilt when thickness or descriptor have been reassigned
+        cache = self._gstr_cache
+        if cache is None or cache[0] is not self._t_nom or cache[1] is not self.descriptor:
+            cache = (self._t_nom, self.descriptor, f'{self.t_nom}{self.descriptor}')
+            self._gstr_cache = cache
+        return cache[2]
 
     def __str__(self):
         return self.to_gstr()
@@ -101,6 +141,10 @@ class Support:
 
 
 class Interlayer(_BaseLayer):
+    __slots__ = ()
+
+    CONTRIBUTES_TO_NOM_THICKNESS = False
+
     PVB = 'PVB'
     SG = 'SG'
     EVA = 'EVA'
@@ -108,8 +152,12 @@ class Interlayer(_BaseLayer):
     MATERIALS = [PVB,SG,EVA]
     THICKNESSES = [0.38, 0.76, 1.52]
 
+    _DESCRIPTOR_INTERN = {m: m for m in MATERIALS}
+
 
 class GasLayer(_BaseLayer):
+    __slots__ = ()
+
     AIR = 'AIR'
     ARGON = 'AR'
     XENON = 'XE'
@@ -118,6 +166,8 @@ class GasLayer(_BaseLayer):
     MATERIALS = [AIR,ARGON,XENON,KRYPTON]
     THICKNESSES = [12, 13.2, 14] # corresponds to 15/32" 1/2", 9/16" spacers
 
+    _DESCRIPTOR_INTERN = {m: m for m in MATERIALS}
+
 # ******************************************************************************************************************
 
 
@@ -126,11 +176,16 @@ class GlassBuildup(_BaseLayer):
     abstract class for all single or multi layer glass buildups
     """
 
-    _height = None
-    _width = None
-    _support = None
-    igdbcode = None
-    igdbflip = False
+    __slots__ = ('_height', '_width', '_support', 'igdbcode', 'igdbflip')
+    _JSON_FIELDS = _BaseLayer._JSON_FIELDS + ('_height', '_width', '_support', 'igdbcode', 'igdbflip')
+
+    def __init__(self, descriptor : str, t:float = _BaseLayer.THICKNESS_NOT_SET):
+        super(GlassBuildup, self).__init__(descriptor, t)
+        self._height = None
+        self._width = None
+        self._support = None
+        self.igdbcode = None
+        self.igdbflip = False
 
     @staticmethod
     def make_glass(
@@ -138,16 +193,56 @@ class GlassBuildup(_BaseLayer):
     ):
         """
         given string description of glass will return glass appropriate glass-subclass object
+
+        Parsed buildups are memoized by g_str; each call returns a fresh copy, so
+        the returned object can be modified without affecting later calls.
         """
+        g_str = g_str.strip()
+        prototype = _GSTR_CACHE.get(g_str)
+        if prototype is None:
+            if _parser is not None:
+                prototype = GlassBuildup._init_from_parsed(_parser.parse_gstr(g_str))
+            else:
+                prototype = GlassBuildup._parse_glass(g_str)
+            if len(_GSTR_CACHE) >= _CACHE_MAX:
+                # evict oldest entry (dicts keep insertion order)
+                del _GSTR_CACHE[next(iter(_GSTR_CACHE))]
+            _GSTR_CACHE[g_str] = prototype
+        return prototype._clone()
+
+    @staticmethod
+    def _parse_glass(
+            g_str: str
+    ):
+        """As make_glass, but always parses, without memoizing"""
+        g_str = g_str.strip()
+        # 'in' stops at the first match & beats str.find for single characters, so
+        # checking the separators in turn is already the cheapest classification
         if Protocol.GAS_SEPARATOR in g_str:
             return InsulatedGlass.init_from_g_str(g_str)
+        elif Protocol.INTERLAYER_SEPARATOR in g_str or g_str.startswith(Protocol.LAM):
+            return LaminatedGlass.init_from_g_str(g_str)
         else:
-            if Protocol.INTERLAYER_SEPARATOR in g_str or g_str.startswith(Protocol.LAM):
-                return LaminatedGlass.init_from_g_str(g_str)
-            else:
+            return MonoGlass.init_from_g_str(g_str)
 
-                return MonoGlass.init_from_g_str(g_str)
+    @staticmethod
+    def _init_from_parsed(parsed):
+        """Builds glass from fields parsed by compiled parser, see _parser.parse_gstr"""
+        if parsed.kind == _parser.MONO:
+            glass = MonoGlass._init_from_fields(parsed.descriptor, parsed.t_nom)
+        else:
+            if parsed.kind == _parser.IGU:
+                cls, separator_cls = InsulatedGlass, GasLayer
+            else:
+                cls, separator_cls = LaminatedGlass, Interlayer
+            glass = cls(
+                [GlassBuildup._init_from_parsed(g) for g in parsed.glass_layers],
+                [separator_cls._init_from_fields(l.descriptor, l.t_nom) for l in parsed.separator_layers],
+            )
 
+        glass.width, glass.height, glass.support = parsed.width, parsed.height, parsed.support
+        glass.igdbcode, glass.igdbflip = parsed.igdbcode, parsed.igdbflip
+        return glass
 
     @property
     def ar(self):
@@ -193,25 +288,20 @@ class GlassBuildup(_BaseLayer):
             str: gstr w/o meta data & hyphen at end
         """
         if Protocol.META in g_str:
-            self.width = gstr.find_number_after_marker(Protocol.WIDTH,g_str,True)
-            self.height = gstr.find_number_after_marker(Protocol.HEIGHT,g_str,True)
-            self.support = gstr.find_number_after_marker(Protocol.SUPPORT,g_str,True)
-            return g_str.split(Protocol.META)[0]
-        else:
-            return g_str
+            g_str, self.width, self.height, self.support = gstr.parse_meta(g_str)
+        return g_str
 
     def add_meta(self,g_str) -> str:
-        s = ''
-        if self.width:
-            s += f'{Protocol.WIDTH}{self._width}'
-        if self.height:
-            s += f'{Protocol.HEIGHT}{self._height}'
-        if self.support:
-            s += f'{Protocol.SUPPORT}{self.support}'
-
-        if s:
-            g_str += f'{Protocol.META}{s}'
-            return g_str
+        parts = []
+        if self._width:
+            parts.append(f'{Protocol.WIDTH}{self._width}')
+        if self._height:
+            parts.append(f'{Protocol.HEIGHT}{self._height}')
+        if self._support:
+            parts.append(f'{Protocol.SUPPORT}{self._support}')
+
+        if parts:
+            return f'{g_str}{Protocol.META}{"".join(parts)}'
         else:
             return g_str
 
@@ -225,18 +315,11 @@ class GlassBuildup(_BaseLayer):
         Returns:
             str: _description_
         """
-
-        if g_str.startswith(Protocol.IGDB_START) and g_str.endswith(Protocol.IGDB_CLOSE_BRACKET):
-            last_br_pair = gstr.find_enclosed_brackets(g_str)[-1]
-            i = g_str.find(Protocol.IGDB_OPEN_BRACKET) #first instance
-            if i == last_br_pair[0]: #cehck last pair is an outer enclosing bracket
-                _x = g_str[1:last_br_pair[0]]
-
-                self.igdbflip = _x.endswith(Protocol.IGDB_FLIP)
-                self.igdbcode = _x.split(Protocol.IGDB_FLIP)[0]
-                return g_str[last_br_pair[0]+1:last_br_pair[1]]
-        # default return is unchanged str
-        return g_str
+        _g_str, igdbcode, igdbflip = gstr.parse_igdbcode(g_str)
+        if igdbcode is not None:
+            self.igdbcode = igdbcode
+            self.igdbflip = igdbflip
+        return _g_str
 
     def add_igdbcode(self, g_str) -> str:
         if self.igdbcode:
@@ -253,24 +336,21 @@ class MonoGlass(GlassBuildup):
 
     THICKNESSES = [4,5,6,8,10,12,15,19,25]
 
+    _DESCRIPTOR_INTERN = {v: v for v in HeatTreatment.VAR}
+
+    __slots__ = ()
+
     @classmethod
     def init_from_g_str(
             cls,
             g_str: str,
     ):
+        g_str, width, height, support = gstr.parse_meta(g_str)
+        g_str, igdbcode, igdbflip = gstr.parse_igdbcode(g_str)
 
-        mono = cls(HeatTreatment.MONO,None)
-
-        g_str = mono.parse_meta(g_str)
-        g_str = mono.parse_igdbcode(g_str)
-        ic(g_str)
-        _m= super(MonoGlass,cls).init_from_g_str(g_str)
-
-
-        mono.descriptor = _m.descriptor
-        mono._t_nom = _m._t_nom
-        mono._t_actual = _m._t_actual
-
+        mono = super(MonoGlass,cls).init_from_g_str(g_str)
+        mono.width, mono.height, mono.support = width, height, support
+        mono.igdbcode, mono.igdbflip = igdbcode, igdbflip
 
         return mono
 
@@ -304,28 +384,77 @@ class MonoGlass(GlassBuildup):
 
 class MultiLayerGlassBuildup(GlassBuildup):
 
+    __slots__ = ('_layers', '_glass_layers', '_separator_layers')
+    _LAYER_COUNT_ERROR : str = "Number of separator layers needs to be one less than number of glass layers"
+    # _t_actual is derived from layers on access, see t_actual, so left out
+    _JSON_FIELDS = tuple(f for f in GlassBuildup._JSON_FIELDS if f != '_t_actual') + ('_layers',)
+
     def __init__(
             self,
             descriptor: str,
             glass_layers : List[GlassBuildup],
             separator_layers : List[ _BaseLayer]
     ):
+        glass_layers, separator_layers = tuple(glass_layers), tuple(separator_layers)
+        # no layers at all is allowed, as an empty buildup
+        if len(separator_layers) != max(len(glass_layers) - 1, 0):
+            raise errors.BuildupException(self._LAYER_COUNT_ERROR)
+
         super(MultiLayerGlassBuildup, self).__init__(descriptor)
-        self._layers : List[_BaseLayer]= [x for x in itertools.chain.from_iterable(itertools.zip_longest(glass_layers,separator_layers)) if x]
+        # glass and separator layers alternate, starting and ending with glass
+        layers : List[_BaseLayer] = [None] * (len(glass_layers) + len(separator_layers))
+        layers[0::2] = glass_layers
+        layers[1::2] = separator_layers
+        self._layers : List[_BaseLayer] = layers
+        # same objects as in _layers
+        self._glass_layers : Tuple[GlassBuildup, ...] = glass_layers
+        self._separator_layers : Tuple[_BaseLayer, ...] = separator_layers
+        # layers' nominal thicknesses are read-only, so summed once
+        self._t_nom = sum(l.t_nom for l in self._layers if l.CONTRIBUTES_TO_NOM_THICKNESS)
+
+    def _clone(self):
+        clone = super(MultiLayerGlassBuildup, self)._clone()
+        clone._layers = [l._clone() for l in self._layers]
+        clone._glass_layers = tuple(clone._layers[0::2])
+        clone._separator_layers = tuple(clone._layers[1::2])
+        return clone
+
+    @classmethod
+    def _init_from_tokens(
+            cls,
+            g_str: str,
+            separator: str,
+            glass_init: Callable[[str], GlassBuildup],
+            separator_init: Callable[[str], _BaseLayer],
+    ):
+        """Builds multi-layer buildup from g_str, layers alternating glass & separator
+
+        Args:
+            g_str (str): g_str of whole buildup
+            separator (str): layer separator in g_str
+            glass_init (Callable[[str], GlassBuildup]): makes glass layer from its g_str
+            separator_init (Callable[[str], _BaseLayer]): makes separator layer from its g_str
+        """
+        layers, width, height, support, igdbcode, igdbflip = gstr.tokenize(g_str, separator)
+
+        # glass layers are even, or zero
+        glass_layers = [glass_init(g) for g in layers[0::2]]
+        separator_layers = [separator_init(g) for g in layers[1::2]]
+
+        buildup = cls(glass_layers, separator_layers)
+        buildup.width, buildup.height, buildup.support = width, height, support
+        buildup.igdbcode, buildup.igdbflip = igdbcode, igdbflip
+
+        return buildup
 
     @property
     def t_actual(self):
-        self._t_actual = 0
-        for l in self._layers:
-            self._t_actual += l.t_actual
+        # summed on each access, as layers' actual thickness can be set after construction
+        self._t_actual = sum(l.t_actual for l in self._layers)
         return self._t_actual
 
     @property
     def t_nom(self):
-        self._t_nom = 0
-        for l in self._layers:
-            if not isinstance(l,Interlayer):
-                self._t_nom += l.t_nom
         return self._t_nom
 
     @property
@@ -335,9 +464,8 @@ class MultiLayerGlassBuildup(GlassBuildup):
     @width.setter
     def width(self,w):
         self._width = w
-        for l in self._layers:
-            if isinstance(l,GlassBuildup):
-                l.width = w
+        for l in self._glass_layers:
+            l.width = w
 
     @property
     def height(self):
@@ -346,9 +474,8 @@ class MultiLayerGlassBuildup(GlassBuildup):
     @height.setter
     def height(self,h):
         self._height = h
-        for l in self._layers:
-            if isinstance(l,GlassBuildup):
-                l.height = h
+        for l in self._glass_layers:
+            l.height = h
 
     @property
     def support(self):
@@ -357,9 +484,8 @@ class MultiLayerGlassBuildup(GlassBuildup):
     @support.setter
     def support(self,s):
         self._support = s
-        for l in self._layers:
-            if isinstance(l,GlassBuildup):
-                l.support = s
+        for l in self._glass_layers:
+            l.support = s
 
 
 # ******************************************************************************************************************
@@ -367,15 +493,14 @@ class MultiLayerGlassBuildup(GlassBuildup):
 
 class LaminatedGlass(MultiLayerGlassBuildup):
 
+    __slots__ = ()
+    _LAYER_COUNT_ERROR = "Number of interlayers needs to be one less than number of plies"
+
     def __init__(
         self,
         plies: List[MonoGlass],
         interlayers: List[Interlayer],
     ):
-
-        if plies and len(interlayers) != len(plies) - 1:
-            raise errors.BuildupException("Number of interlayers needs to be one less than number of plies")
-
         super(LaminatedGlass, self).__init__('lam',plies,interlayers)
 
     @classmethod
@@ -383,27 +508,13 @@ class LaminatedGlass(MultiLayerGlassBuildup):
             cls,
             g_str: str,
     ):
-        lam = cls([],[]) #just a dummy
-        g_str = lam.parse_meta(g_str)
-        g_str = lam.parse_igdbcode(g_str)
-
-        for i, g in enumerate(g_str.split(Protocol.INTERLAYER_SEPARATOR)):
-            if (i % 2) == 0:  # monoglass layer are even, or zero
-                m = MonoGlass.init_from_g_str(g)
-                lam._layers.append(m)
-            else:  # interlayer
-                il = Interlayer.init_from_g_str(g)
-                lam._layers.append(il)
-
-        return lam
+        return cls._init_from_tokens(
+            g_str, Protocol.INTERLAYER_SEPARATOR, MonoGlass.init_from_g_str, Interlayer.init_from_g_str)
 
 
 
     def to_gstr(self, inc_meta = True):
-        _g = []
-        for l in self._layers:
-            _g.append(l.to_gstr(inc_meta=False))
-        g =  Protocol.INTERLAYER_SEPARATOR.join(_g)
+        g = Protocol.INTERLAYER_SEPARATOR.join([l.to_gstr(inc_meta=False) for l in self._layers])
 
         g = self.add_igdbcode(g)
 
@@ -414,24 +525,24 @@ class LaminatedGlass(MultiLayerGlassBuildup):
 
 
     @property
-    def plies(self) -> List[MonoGlass]:
-        """Return list of laminated glass buildup glass plies, out to in
+    def plies(self) -> Tuple[MonoGlass, ...]:
+        """Return laminated glass buildup glass plies, out to in
 
         Returns:
-            List[MonoGlass]: list of plies
+            Tuple[MonoGlass, ...]: plies
         """
 
-        return self._layers[0::2]
+        return self._glass_layers
 
 
     @property
-    def interlayers(self) -> List[Interlayer]:
-        """Return list of laminated glass buildup interlayer, out to in
+    def interlayers(self) -> Tuple[Interlayer, ...]:
+        """Return laminated glass buildup interlayers, out to in
 
         Returns:
-            List[Interlayer]: list of interlayers
+            Tuple[Interlayer, ...]: interlayers
         """
-        return self._layers[1::2]
+        return self._separator_layers
 
 
 
@@ -440,6 +551,9 @@ class LaminatedGlass(MultiLayerGlassBuildup):
 
 class InsulatedGlass(MultiLayerGlassBuildup):
 
+    __slots__ = ()
+    _LAYER_COUNT_ERROR = "Number of gas gaps needs to be one less than number of lites"
+
 
 
     def __init__(
@@ -447,19 +561,11 @@ class InsulatedGlass(MultiLayerGlassBuildup):
             lites: List[GlassBuildup],
             gases: List[GasLayer]
     ):
-
-        if lites and len(gases) != len(lites) - 1:
-            raise errors.BuildupException("Number of gas gaps needs to be one less than number of lites")
-
         super(InsulatedGlass, self).__init__('igu', lites,gases)
 
     def to_gstr(self, inc_meta = True):
-        _g = []
-        for i,l in enumerate(self.lites):
-
-            _g.append(l.to_gstr(inc_meta=False))
-            if i<len(self.gases): _g.append(self.gases[i].to_gstr(inc_meta=False))
-        g = Protocol.GAS_SEPARATOR.join(_g)
+        # lites & gases alternate in _layers
+        g = Protocol.GAS_SEPARATOR.join([l.to_gstr(inc_meta=False) for l in self._layers])
 
         g = self.add_igdbcode(g)
 
@@ -473,46 +579,62 @@ class InsulatedGlass(MultiLayerGlassBuildup):
             cls,
             g_str: str,
     ):
-
-        igu = cls([],[]) #just a dummy
-
-        g_str = igu.parse_meta(g_str)
-        g_str = igu.parse_igdbcode(g_str)
-
-
-        for i, g in enumerate(g_str.split(Protocol.GAS_SEPARATOR)):
-            if (i % 2) == 0:  # glass lite (mono or lam) are even or zero
-                # todo
-                lite = GlassBuildup.make_glass(g)
-                igu._layers.append(lite)
-            else:  # gas
-                gas = GasLayer.init_from_g_str(g)
-                igu._layers.append(gas)
-
-        return igu
+        return cls._init_from_tokens(
+            g_str, Protocol.GAS_SEPARATOR, GlassBuildup._parse_glass, GasLayer.init_from_g_str)
 
     @property
-    def lites(self) -> List[GlassBuildup]:
-        """Return list of IGU buildup lites, out to in
+    def lites(self) -> Tuple[GlassBuildup, ...]:
+        """Return IGU buildup lites, out to in
 
         Returns:
-            List[GlassBuildup]: list of lites
+            Tuple[GlassBuildup, ...]: lites
         """
 
-        return self._layers[0::2]
+        return self._glass_layers
 
     @property
-    def gases(self) -> List[GasLayer]:
-        """Return list of IGU buildup gass layers, out to in
+    def gases(self) -> Tuple[GasLayer, ...]:
+        """Return IGU buildup gas layers, out to in
 
         Returns:
-            List[GasLayer]: list of gas layers
+            Tuple[GasLayer, ...]: gas layers
         """
-        return self._layers[1::2]
+        return self._separator_layers
 
 class GlassJsonEncoder(json.JSONEncoder):
     def default(self, z):
         if isinstance(z, _BaseLayer):
-            return z._to_json()
+            d = {name: getattr(z, name) for name in z._JSON_FIELDS}
+            d['__meta__'] = False
+            d['__type__'] = type(z).__name__
+            return d
         else:
             return super().default(z)
+
+
+def parse_many(gstrs : List[str], workers : int = None) -> List[GlassBuildup]:
+    """Makes glass for each of many g_strs, e.g. loading a catalog, across processes
+
+    Each g_str parses independently, so they are shared across a process pool to sidestep
+    the GIL. For a few g_strs the pool start up costs more than it saves; use
+    GlassBuildup.make_glass directly.
+
+    Where processes are spawned rather than forked (macOS, Windows), workers re-import
+    the calling script, so call this from under an ``if __name__ == '__main__':`` guard.
+
+    Args:
+        gstrs (List[str]): g_strs to parse
+        workers (int, optional): number of processes. Defaults to os.cpu_count()
+
+    Returns:
+        List[GlassBuildup]: glass for each g_str, in the same order
+    """
+    if not gstrs:
+        return []
+    # imported here, as it is slow to import & only needed for bulk loading
+    import multiprocessing
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(gstrs) // workers // 4)
+    with multiprocessing.Pool(workers) as p:
+        return p.map(GlassBuildup.make_glass, gstrs, chunksize=chunksize)
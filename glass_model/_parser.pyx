@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled g_str parser, for bulk loading of buildups.
+Mirrors GlassBuildup.make_glass & the init_from_g_str classmethods, but scans the
+g_str in C, by index, & returns ParsedGstr trees of typed fields. GlassBuildup.make_glass
+uses it when it has been built, & builds the layer objects from the fields.
+
+Anything outside the usual g_str shapes (signed or malformed meta numbers, layers
+not starting with their thickness, numbers too long for an exact double) is handed
+to the gstr module, so results always match the pure python parser.
+
+Google Python Style Guide:
+http://google.github.io/styleguide/pyguide.html
+"""
+
+__author__ = "Jon Robinson"
+__copyright__ = "Copyright 2024, Jon Robinson. All rights reserved"
+__email__ = "jonrobinson1980@gmail.com"
+
+
+from cpython.unicode cimport Py_UNICODE_ISSPACE
+from libc.math cimport floor
+
+from glass_model import gstr
+
+
+MONO = 'mono'
+LAM = 'lam'
+IGU = 'igu'
+LAYER = 'layer' # interlayer or gas
+
+
+# kinds of number held in a ParsedGstr
+cdef enum:
+    NUM_NONE = 0
+    NUM_INT = 1
+    NUM_FLOAT = 2
+    NUM_OBJECT = 3 # python int/float, converted by gstr
+
+# digits that always convert to a double exactly, so m / 10**n rounds as float() does
+cdef enum:
+    MAX_EXACT_DIGITS = 15
+
+cdef double _POW10[MAX_EXACT_DIGITS + 1]
+_POW10[0] = 1.0
+for _i in range(1, MAX_EXACT_DIGITS + 1):
+    _POW10[_i] = _POW10[_i - 1] * 10.0
+
+
+cdef object _number(double value, int kind, object obj):
+    if kind == NUM_INT:
+        return <long long>value
+    elif kind == NUM_FLOAT:
+        return value
+    elif kind == NUM_OBJECT:
+        return obj
+    return None
+
+
+cdef class ParsedGstr:
+    """Fields parsed from a g_str, for one layer
+
+    Attributes:
+        kind (str): MONO, LAM, IGU or LAYER
+        descriptor (str): heat treatment or material, MONO & LAYER only
+        t_nom (Union[int,float]): nominal thickness, MONO & LAYER only
+        width, height, support (Union[int,float]): meta data, None if not given
+        igdbcode (str), igdbflip (bool): IGDB code, None & False if not given
+        glass_layers (List[ParsedGstr]): plies or lites, LAM & IGU only
+        separator_layers (List[ParsedGstr]): interlayers or gases, LAM & IGU only
+    """
+    cdef readonly str kind
+    cdef readonly str descriptor
+    cdef readonly object igdbcode
+    cdef readonly bint igdbflip
+    cdef readonly list glass_layers
+    cdef readonly list separator_layers
+
+    cdef double _t_nom
+    cdef int _t_nom_kind
+    cdef object _t_nom_obj
+    # width, height, support
+    cdef double _meta[3]
+    cdef int _meta_kind[3]
+    cdef list _meta_obj
+
+    @property
+    def t_nom(self):
+        return _number(self._t_nom, self._t_nom_kind, self._t_nom_obj)
+
+    @property
+    def width(self):
+        return self._meta_number(0)
+
+    @property
+    def height(self):
+        return self._meta_number(1)
+
+    @property
+    def support(self):
+        return self._meta_number(2)
+
+    cdef object _meta_number(self, int i):
+        return _number(self._meta[i], self._meta_kind[i], self._meta_obj[i] if self._meta_obj else None)
+
+
+cdef inline bint _is_digit(Py_UCS4 c) noexcept:
+    return u'0' <= c <= u'9'
+
+
+cdef inline int _digit(Py_UCS4 c) noexcept:
+    return <int>c - 48 # ord('0')
+
+
+cdef Py_ssize_t _find(str s, Py_UCS4 c, Py_ssize_t start, Py_ssize_t end):
+    cdef Py_ssize_t i
+    for i in range(start, end):
+        if s[i] == c:
+            return i
+    return -1
+
+
+cdef Py_ssize_t _scan_number(str s, Py_ssize_t i, Py_ssize_t end, double* value, int* kind):
+    """Scans a leading int or float in s[i:end], as gstr._number_prefix_end
+
+    Returns index just past it, i if none. kind is NUM_OBJECT if too long to convert
+    exactly here, leaving the conversion to the caller
+    """
+    cdef Py_ssize_t start = i
+    cdef long long mantissa = 0
+    cdef int n_digits = 0
+    cdef int n_frac = 0
+    cdef double x
+
+    while i < end and _is_digit(s[i]):
+        if n_digits < MAX_EXACT_DIGITS + 1:
+            mantissa = mantissa * 10 + _digit(s[i])
+        n_digits += 1
+        i += 1
+    if i == start:
+        return start
+    # only take the decimal point if digits follow, so '6.A' -> '6'
+    if i < end - 1 and s[i] == u'.' and _is_digit(s[i + 1]):
+        i += 1
+        while i < end and _is_digit(s[i]):
+            if n_digits < MAX_EXACT_DIGITS + 1:
+                mantissa = mantissa * 10 + _digit(s[i])
+            n_digits += 1
+            n_frac += 1
+            i += 1
+
+    if n_digits > MAX_EXACT_DIGITS:
+        kind[0] = NUM_OBJECT
+    elif n_frac == 0:
+        value[0] = <double>mantissa
+        kind[0] = NUM_INT
+    else:
+        x = mantissa / _POW10[n_frac]
+        value[0] = x
+        kind[0] = NUM_INT if x == floor(x) else NUM_FLOAT
+    return i
+
+
+cdef bint _is_bracket_pair(str s, Py_ssize_t open_i, Py_ssize_t close_i):
+    # as gstr._is_bracket_pair
+    cdef Py_ssize_t i
+    cdef int depth = 0
+    cdef Py_UCS4 c
+    for i in range(open_i + 1, close_i):
+        c = s[i]
+        if c == u'(':
+            depth += 1
+        elif c == u')':
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+cdef bint _scan_meta(ParsedGstr p, str s, Py_ssize_t i, Py_ssize_t end):
+    """Reads meta data s[i:end], e.g. 'W3000H4000SUPPORT4', into p
+
+    Returns False, leaving p unset, if s[i:end] is not only markers & unsigned numbers
+    """
+    cdef int m
+    cdef Py_ssize_t j
+    cdef double value
+    cdef int kind
+    cdef double found[3]
+    cdef int found_kind[3]
+
+    found_kind[0] = found_kind[1] = found_kind[2] = NUM_NONE
+    while i < end:
+        if s[i] == u'W':
+            m = 0
+            i += 1
+        elif s[i] == u'H':
+            m = 1
+            i += 1
+        elif (
+            end - i >= 7 and s[i] == u'S' and s[i + 1] == u'U' and s[i + 2] == u'P' and s[i + 3] == u'P'
+            and s[i + 4] == u'O' and s[i + 5] == u'R' and s[i + 6] == u'T'
+        ):
+            m = 2
+            i += 7
+        else:
+            return False
+
+        j = _scan_number(s, i, end, &value, &kind)
+        if j == i or kind == NUM_OBJECT:
+            return False
+        # last of each marker wins, as gstr.parse_meta
+        found[m] = value
+        found_kind[m] = kind
+        i = j
+
+    for m in range(3):
+        p._meta[m] = found[m]
+        p._meta_kind[m] = found_kind[m]
+    return True
+
+
+cdef void _parse_meta(ParsedGstr p, str s, Py_ssize_t i, Py_ssize_t end):
+    # meta data s[i:end], after hyphen
+    cdef int m
+    if _scan_meta(p, s, i, end):
+        return
+
+    # anything unusual, read as gstr.parse_meta does
+    found = dict(gstr._META_RE.findall(s, i, end))
+    p._meta_obj = [None, None, None]
+    for m, marker in enumerate((gstr.Protocol.WIDTH, gstr.Protocol.HEIGHT, gstr.Protocol.SUPPORT)):
+        x = found.get(marker)
+        if x is not None:
+            p._meta_obj[m] = gstr._to_number(x)
+            p._meta_kind[m] = NUM_OBJECT
+
+
+cdef Py_ssize_t _split_meta(ParsedGstr p, str s, Py_ssize_t start, Py_ssize_t end):
+    """Parses any meta data at end of s[start:end] into p, returning where it starts"""
+    cdef Py_ssize_t meta_i = _find(s, u'-', start, end)
+    if meta_i == -1:
+        return end
+    _parse_meta(p, s, meta_i + 1, end)
+    return meta_i
+
+
+cdef bint _split_igdbcode(ParsedGstr p, str s, Py_ssize_t start, Py_ssize_t end, Py_ssize_t* inner):
+    """Parses IGDB code wrapped around s[start:end] into p, as gstr.parse_igdbcode
+
+    Returns whether there is one, setting inner to the start & end inside its brackets
+    """
+    cdef Py_ssize_t open_i
+    cdef Py_ssize_t x_i
+    if end - start < 2 or s[start] != u'#' or s[end - 1] != u')':
+        return False
+    open_i = _find(s, u'(', start, end)
+    if open_i == -1 or not _is_bracket_pair(s, open_i, end - 1):
+        return False
+
+    x_i = _find(s, u'x', start + 1, open_i)
+    p.igdbcode = s[start + 1:open_i if x_i == -1 else x_i]
+    p.igdbflip = open_i - 1 > start and s[open_i - 1] == u'x'
+    inner[0] = open_i + 1
+    inner[1] = end - 1
+    return True
+
+
+cdef ParsedGstr _parse_layer(ParsedGstr p, str s, Py_ssize_t start, Py_ssize_t end, str kind):
+    # thickness then descriptor, as _BaseLayer.init_from_g_str
+    cdef Py_ssize_t j
+    while start < end and Py_UNICODE_ISSPACE(s[start]):
+        start += 1
+    while end > start and Py_UNICODE_ISSPACE(s[end - 1]):
+        end -= 1
+
+    j = _scan_number(s, start, end, &p._t_nom, &p._t_nom_kind)
+    if j == start:
+        # no leading number, read as gstr does
+        g_str = s[start:end]
+        p._t_nom_obj, j = gstr.find_first_number_with_end(g_str)
+        p._t_nom_kind = NUM_OBJECT
+        p.descriptor = g_str[j:]
+    else:
+        if p._t_nom_kind == NUM_OBJECT:
+            p._t_nom_obj = gstr._to_number(s[start:j])
+        p.descriptor = s[j:end]
+    p.kind = kind
+    return p
+
+
+cdef ParsedGstr _new():
+    cdef ParsedGstr p = ParsedGstr.__new__(ParsedGstr)
+    p._meta_kind[0] = p._meta_kind[1] = p._meta_kind[2] = NUM_NONE
+    return p
+
+
+cdef ParsedGstr _parse_mono(str s, Py_ssize_t start, Py_ssize_t end):
+    # as MonoGlass.init_from_g_str
+    cdef ParsedGstr p = _new()
+    cdef Py_ssize_t inner[2]
+    end = _split_meta(p, s, start, end)
+    if _split_igdbcode(p, s, start, end, inner):
+        start, end = inner[0], inner[1]
+    return _parse_layer(p, s, start, end, MONO)
+
+
+cdef ParsedGstr _parse_multi(str s, Py_ssize_t start, Py_ssize_t end, str kind, Py_UCS4 separator):
+    # as MultiLayerGlassBuildup._init_from_tokens
+    cdef ParsedGstr p = _new()
+    cdef Py_ssize_t inner[2]
+    cdef Py_ssize_t i
+    cdef bint is_glass = True
+
+    end = _split_meta(p, s, start, end)
+    if _split_igdbcode(p, s, start, end, inner):
+        start, end = inner[0], inner[1]
+
+    p.glass_layers = []
+    p.separator_layers = []
+    while True:
+        i = _find(s, separator, start, end)
+        if i == -1:
+            i = end
+        if not is_glass:
+            p.separator_layers.append(_parse_layer(_new(), s, start, i, LAYER))
+        elif kind == IGU:  # lites may be mono or laminated
+            p.glass_layers.append(_parse_glass(s, start, i))
+        else:
+            p.glass_layers.append(_parse_mono(s, start, i))
+        if i == end:
+            break
+        is_glass = not is_glass
+        start = i + 1
+
+    p.kind = kind
+    return p
+
+
+cdef ParsedGstr _parse_glass(str s, Py_ssize_t start, Py_ssize_t end):
+    # as GlassBuildup._parse_glass, classifying in one pass
+    cdef Py_ssize_t i
+    cdef Py_UCS4 c
+    cdef bint is_lam = False
+
+    while start < end and Py_UNICODE_ISSPACE(s[start]):
+        start += 1
+    while end > start and Py_UNICODE_ISSPACE(s[end - 1]):
+        end -= 1
+
+    for i in range(start, end):
+        c = s[i]
+        if c == u'_':
+            return _parse_multi(s, start, end, IGU, u'_')
+        elif c == u'&':
+            is_lam = True
+
+    if is_lam or (end - start >= 3 and s[start] == u'L' and s[start + 1] == u'A' and s[start + 2] == u'M'):
+        return _parse_multi(s, start, end, LAM, u'&')
+    return _parse_mono(s, start, end)
+
+
+cpdef ParsedGstr parse_gstr(str g_str):
+    """Parses g_str of any buildup, as GlassBuildup.make_glass
+
+    Args:
+        g_str (str): e.g. '#20(6A)_12AIR_6A&0.76PVB&6A-W3000H4000SUPPORT4'
+
+    Returns:
+        ParsedGstr: parsed fields of buildup
+    """
+    return _parse_glass(g_str, 0, len(g_str))
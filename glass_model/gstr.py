@@ -12,7 +12,7 @@ __copyright__ = "Copyright 2020, Jon Robinson. All rights reserved"
 __email__ = "jonrobinson1980@gmail.com"
 
 
-from typing import List, Union
+from typing import Dict, List, Pattern, Tuple, Union
 import re
 
 
@@ -35,43 +35,66 @@ class Protocol:
     IGU = 'IGU'
 
 
+_DIGITS = '0123456789'
+
+# compiled once at import, rather than on every parse call
+_FIRST_NUMBER_RE : Pattern = re.compile(r'\b\d+\.\d+|\b\d+')
+_MARKER_RE_CACHE : Dict[str, Pattern] = {}
+
+
+def _marker_re(marker: str) -> Pattern:
+    pattern = _MARKER_RE_CACHE.get(marker)
+    if pattern is None:
+        pattern = re.compile(re.escape(marker) + r'([-+]?(?:\d*\.*\d+))')
+        _MARKER_RE_CACHE[marker] = pattern
+    return pattern
+
+# any meta data marker & its number. SUPPORT first, being the longest marker
+_META_RE : Pattern = re.compile(
+    '(' + '|'.join(re.escape(m) for m in (Protocol.SUPPORT, Protocol.WIDTH, Protocol.HEIGHT)) + ')'
+    + r'([-+]?(?:\d*\.*\d+))')
+
+
+
+def _number_prefix_end(s: str) -> int:
+    """Index just past a leading int or float in s, e.g. 4 for '0.76PVB'
+
+    Returns 0 when s does not start with a number.
+    """
+    n = len(s)
+    i = 0
+    while i < n and s[i] in _DIGITS:
+        i += 1
+    # only take the decimal point if digits follow, so '6.A' -> '6'
+    if 0 < i < n - 1 and s[i] == '.' and s[i + 1] in _DIGITS:
+        i += 2
+        while i < n and s[i] in _DIGITS:
+            i += 1
+    return i
+
 
 def mysplit(s):
-    x = s.split('.')
-    if len(x) == 2:
-        s = x[-1]
-    print (s)
-    tail = s.lstrip('0123456789')
-
-
-    head = s[:-len(tail)]
-    if len(x) == 2:
-        head = x[0] + '.' + head
-    
-    return head, tail
-
-
-def find_enclosed_brackets(s):
-    stack = []
-    enclosed_pairs = []
-    
-    for i, char in enumerate(s):
-        if char == '(':
-            stack.append(i)
-        elif char == ')':
-            if stack:
-                enclosed_pairs.append((stack.pop(), i))
-                i1 =enclosed_pairs[-1][0]
-                i0 = s[:enclosed_pairs[-1][0]].rfind('#')
-
-
-            else:
-                print("Error: Unmatched closing bracket at index", i)
-    
-    if stack:
-        print("Error: Unmatched opening brackets at indices", stack)
-    
-    return enclosed_pairs
+    i = _number_prefix_end(s)
+    return s[:i], s[i:]
+
+
+def _is_bracket_pair(s: str, open_i: int, close_i: int) -> bool:
+    if (
+        s.find(Protocol.IGDB_OPEN_BRACKET, open_i + 1, close_i) != -1
+        or s.find(Protocol.IGDB_CLOSE_BRACKET, open_i + 1, close_i) != -1
+    ):
+        # nested brackets, e.g. '#1(6A)_12AIR_#2(6A)', so check none close the first
+        # early & all inside are closed
+        depth = 0
+        for char in s[open_i + 1:close_i]:
+            if char == Protocol.IGDB_OPEN_BRACKET:
+                depth += 1
+            elif char == Protocol.IGDB_CLOSE_BRACKET:
+                depth -= 1
+                if depth < 0:
+                    return False
+        return depth == 0
+    return True
 
 
 def find_number_after_marker(marker: str,string :str,after_last = False) -> Union[int,float]:
@@ -85,10 +108,8 @@ def find_number_after_marker(marker: str,string :str,after_last = False) -> Unio
     Returns:
         Union[int,float]: number as float or int,
     """
-     
-    pattern = r'' +marker + '([-+]?(?:\d*\.*\d+))'
-    
-    match = re.findall(pattern, string)
+
+    match = _marker_re(marker).findall(string)
     # If a match is found, return the number after 'x'
     if match:
         
@@ -100,15 +121,101 @@ def find_number_after_marker(marker: str,string :str,after_last = False) -> Unio
         return None
 
 
-def find_first_number(input_string):
-    # Regular expression to match float or int
-    pattern = r'\b\d+\.\d+|\b\d+'
-    match = re.search(pattern, input_string)
+def _to_number(x: str) -> Union[int,float]:
+    if '.' not in x:
+        return int(x)
+    x = float(x)
+    if x == int(x):
+        return int(x)
+    return x
+
+
+def find_first_number_with_end(input_string: str) -> Tuple[Union[int,float], int]:
+    """Finds first number in string, and where it ends
+
+    Args:
+        input_string (str): string to search, e.g. '0.76PVB'
+
+    Returns:
+        Tuple[Union[int,float],int]: number as float or int (None if not found), and
+            index just past it (0 if not found), e.g. (0.76, 4)
+    """
+    # g_str layers lead with their thickness, so scan for that before falling
+    # back to regular expression to match float or int anywhere
+    i = _number_prefix_end(input_string)
+    if i:
+        return _to_number(input_string[:i]), i
+
+    match = _FIRST_NUMBER_RE.search(input_string)
     if match:
-        x = float(match.group())
-        if x == int(x):
-            return int(x)
-        return x 
+        return _to_number(match.group()), match.end()
     else:
-        return None
+        return None, 0
+
+
+def find_first_number(input_string):
+    return find_first_number_with_end(input_string)[0]
+
+
+def parse_meta(g_str: str) -> Tuple[str, Union[int,float], Union[int,float], Union[int,float]]:
+    """Parses metadata, e.g. width, height, support condition at end of g_str, after hyphen
+
+    Args:
+        g_str (str): e.g. '6A-W3000H4000SUPPORT4'
+
+    Returns:
+        Tuple[str,Union[int,float],Union[int,float],Union[int,float]]: gstr w/o meta data & hyphen
+            at end, then width, height & support (None if not given)
+    """
+    i = g_str.find(Protocol.META)
+    if i == -1:
+        return g_str, None, None, None
+
+    # one pass over the meta data for all markers, last of each one wins
+    found = dict(_META_RE.findall(g_str, i + 1))
+    width = found.get(Protocol.WIDTH)
+    height = found.get(Protocol.HEIGHT)
+    support = found.get(Protocol.SUPPORT)
+    return (
+        g_str[:i],
+        None if width is None else _to_number(width),
+        None if height is None else _to_number(height),
+        None if support is None else _to_number(support),
+    )
+
+
+def parse_igdbcode(g_str: str) -> Tuple[str, str, bool]:
+    """Parses IGDB code wrapped around g_str, e.g. '#20x(6A)'
 
+    Args:
+        g_str (str): gstr, w/o meta data
+
+    Returns:
+        Tuple[str,str,bool]: gstr inside the IGDB brackets, IGDB code & whether flipped. If
+            g_str has no IGDB code, it is returned unchanged with None & False
+    """
+    # slices, not indices, so empty g_str is fine
+    if g_str[:1] == Protocol.IGDB_START and g_str[-1:] == Protocol.IGDB_CLOSE_BRACKET:
+        open_i = g_str.find(Protocol.IGDB_OPEN_BRACKET)
+        close_i = len(g_str) - 1
+        if open_i != -1 and _is_bracket_pair(g_str, open_i, close_i): # outer enclosing pair
+            _x = g_str[1:open_i]
+            return g_str[open_i+1:close_i], _x.split(Protocol.IGDB_FLIP)[0], _x.endswith(Protocol.IGDB_FLIP)
+    # default return is unchanged str
+    return g_str, None, False
+
+
+def tokenize(g_str: str, separator: str) -> Tuple[List[str], Union[int,float], Union[int,float], Union[int,float], str, bool]:
+    """Splits multi-layer g_str into its layers' g_strs, meta data & IGDB code
+
+    Args:
+        g_str (str): e.g. '#20(6A_12AIR_6A)-W3000'
+        separator (str): layer separator, Protocol.GAS_SEPARATOR or Protocol.INTERLAYER_SEPARATOR
+
+    Returns:
+        Tuple[List[str],Union[int,float],Union[int,float],Union[int,float],str,bool]: layer g_strs,
+            then width, height & support as parse_meta, then IGDB code & flip as parse_igdbcode
+    """
+    g_str, width, height, support = parse_meta(g_str)
+    g_str, igdbcode, igdbflip = parse_igdbcode(g_str)
+    return g_str.split(separator), width, height, support, igdbcode, igdbflip
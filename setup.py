@@ -2,7 +2,7 @@
 
 """The setup script."""
 
-from setuptools import setup, find_packages
+from setuptools import Extension, setup, find_packages
 
 with open('README.rst') as readme_file:
     readme = readme_file.read()
@@ -14,6 +14,20 @@ requirements = [ ]
 
 test_requirements = ['pytest>=3', ]
 
+# compiled g_str parser is optional, glass_model falls back to pure python without it
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize(
+        [Extension('glass_model._parser', ['glass_model/_parser.pyx'], optional=True)],
+        language_level=3,
+    )
+    # optional, so a failed compile (e.g. no C compiler) also falls back. Set again
+    # as cythonize does not carry it over to the extensions it returns
+    for ext in ext_modules:
+        ext.optional = True
+except ImportError:
+    ext_modules = []
+
 setup(
     author="Jon Robinson",
     author_email='jonrobinson1980@gmail.com',
@@ -29,6 +43,7 @@ setup(
         'Programming Language :: Python :: 3.8',
     ],
     description="OOP glass model and shortcode generator and parser",
+    ext_modules=ext_modules,
     install_requires=requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
@@ -2,10 +2,14 @@
 
 """Tests for `glass_model` package."""
 
+import json
+import weakref
+
 import pytest
 
 
-from glass_model import glass_model
+import glass_model
+from glass_model import GlassBuildup
 
 
 @pytest.fixture
@@ -22,3 +26,218 @@ def test_content(response):
     """Sample pytest test function with the pytest fixture as an argument."""
     # from bs4 import BeautifulSoup
     # assert 'GitHub' in BeautifulSoup(response.content).title.string
+
+
+IGU_GSTR = '#20(6A)_12AIR_6A&0.76PVB&6A-W3000H4000SUPPORT4'
+
+
+@pytest.fixture
+def empty_cache():
+    glass_model._GSTR_CACHE.clear()
+    yield glass_model._GSTR_CACHE
+    glass_model._GSTR_CACHE.clear()
+
+
+def test_make_glass_caches_top_level_gstr_only(empty_cache):
+    GlassBuildup.make_glass(IGU_GSTR)
+    assert list(empty_cache) == [IGU_GSTR]
+
+
+def test_make_glass_result_mutation_does_not_leak(empty_cache):
+    igu = GlassBuildup.make_glass(IGU_GSTR)
+    igu.width = 1000
+    igu.igdbcode = '7'
+    igu.lites[0].igdbcode = '99'
+    igu.lites[1].plies[0].t_actual = 5.8
+
+    igu2 = GlassBuildup.make_glass(IGU_GSTR)
+    assert igu2 is not igu
+    assert igu2.to_gstr() == IGU_GSTR
+    assert igu2.lites[0].igdbcode == '20'
+    assert igu2.lites[1].plies[0].t_actual == 6
+
+
+def test_make_glass_cache_evicts_oldest(empty_cache, monkeypatch):
+    monkeypatch.setattr(glass_model, '_CACHE_MAX', 2)
+    for g in ('6A', '8T', '10HS'):
+        GlassBuildup.make_glass(g)
+    assert list(empty_cache) == ['8T', '10HS']
+
+
+def test_multi_layer_t_actual_follows_layer_changes():
+    lam = glass_model.LaminatedGlass(
+        [glass_model.MonoGlass('A', 6), glass_model.MonoGlass('A', 6)],
+        [glass_model.Interlayer('PVB', 0.76)])
+    assert lam.t_actual == pytest.approx(12.76)
+
+    lam.plies[0].t_actual = 5.8
+    assert lam.t_actual == pytest.approx(12.56)
+    assert lam.t_nom == 12
+
+
+@pytest.mark.parametrize('g_str', ['#20((6A)', '#20(6A))', '#1(6A)_12AIR_#2(6A'])
+def test_unbalanced_igdb_brackets_rejected(g_str):
+    with pytest.raises(glass_model.errors.BuildupException):
+        GlassBuildup.make_glass(g_str)
+
+
+def test_nested_igdb_brackets():
+    igu = GlassBuildup.make_glass('#9(#1(6A)_12AIR_#2(6A))')
+    assert igu.igdbcode == '9'
+    assert [l.igdbcode for l in igu.lites] == ['1', '2']
+
+
+def test_layer_views_cannot_be_appended_to():
+    lam = GlassBuildup.make_glass('6A&0.76PVB&6A')
+    with pytest.raises(AttributeError):
+        lam.plies.append(glass_model.MonoGlass('A', 8))
+    assert len(lam.plies) == 2
+    assert lam.to_gstr() == '6A&0.76PVB&6A'
+
+    igu = GlassBuildup.make_glass('6A_12AIR_6A')
+    assert igu.lites == (igu._layers[0], igu._layers[2])
+    assert igu.gases == (igu._layers[1],)
+
+
+@pytest.mark.parametrize('g_str', [
+    '6A',
+    '#20x(6A)-W3000H4000SUPPORT4',
+    '6.38A-W1200.5H2000',
+    '6A&0.76PVB&6A',
+    IGU_GSTR,
+    '6A_12AR_6A_12AR_6T',
+    '#7(6A&1.52SG&6HS)_13.2KR_#3x(8TS)-W900H1800SUPPORT2',
+    '#9(#1(6A)_12AIR_#2x(6A&0.76PVB&6A))-W1H2',
+])
+def test_gstr_round_trip(g_str):
+    assert GlassBuildup.make_glass(g_str).to_gstr() == g_str
+
+
+def test_igu_fields_from_gstr():
+    igu = GlassBuildup.make_glass(IGU_GSTR)
+    assert isinstance(igu, glass_model.InsulatedGlass)
+    assert (igu.width, igu.height, igu.support) == (3000, 4000, 4)
+    assert igu.t_nom == 30
+    assert igu.t_actual == pytest.approx(30.76)
+    assert igu.lites[0].igdbcode == '20'
+    assert isinstance(igu.lites[1], glass_model.LaminatedGlass)
+    assert igu.gases[0].descriptor == glass_model.GasLayer.AIR
+
+
+def test_parsed_meta_propagates_to_child_layers():
+    igu = GlassBuildup.make_glass(IGU_GSTR)
+    lam = igu.lites[1]
+    for glass in (igu.lites[0], lam, lam.plies[0], lam.plies[1]):
+        assert (glass.width, glass.height, glass.support) == (3000, 4000, 4)
+
+
+@pytest.mark.parametrize('g_str', ['6A&0.76PVB', '6A&0.76PVB&6A&0.76PVB', '6A_12AIR'])
+def test_unbalanced_layer_counts_rejected(g_str):
+    with pytest.raises(glass_model.errors.BuildupException):
+        GlassBuildup.make_glass(g_str)
+
+
+def _fields(glass):
+    fields = [
+        type(glass).__name__, glass.to_gstr(), glass.t_nom, type(glass.t_nom), glass.t_actual,
+        glass.width, glass.height, glass.support, glass.igdbcode, glass.igdbflip,
+    ]
+    for layer in getattr(glass, '_layers', ()):
+        if isinstance(layer, GlassBuildup):
+            fields.append(_fields(layer))
+        else:
+            fields.append((type(layer).__name__, layer.descriptor, layer.t_nom, type(layer.t_nom)))
+    return fields
+
+
+@pytest.mark.parametrize('g_str', [
+    '6A', '10T', ' 6.38A ', '#20x(6A)-W3000H4000SUPPORT4', '6A&0.76PVB&6A', ' 6A & 0.76PVB & 6A ',
+    IGU_GSTR, '6A_12AR_6A_12AR_6T', '#9(#1(6A)_12AIR_#2x(6A&0.76PVB&6A))-W1H2',
+    '#7(6A&1.52SG&6HS)_13.2KR_#3x(8TS)-W900H1800SUPPORT2', '6.0A-W1200.5H2000.0',
+    '6A-W+3000H-4000', '6A-W30.00.5', '6A-SUPPORTW3H', '1234567890123456.5A', '6A-W12345678901234567',
+])
+def test_compiled_parser_matches_python(g_str):
+    _parser = pytest.importorskip('glass_model._parser')
+    parsed = GlassBuildup._init_from_parsed(_parser.parse_gstr(g_str))
+    assert _fields(parsed) == _fields(GlassBuildup._parse_glass(g_str))
+
+
+def test_json_encoder_fields():
+    igu = GlassBuildup.make_glass(IGU_GSTR)
+    before = {name: getattr(igu, name) for name in igu._ALL_SLOTS}
+    d = json.loads(json.dumps(igu, cls=glass_model.GlassJsonEncoder))
+
+    assert d['__type__'] == 'InsulatedGlass'
+    assert set(d) == set(glass_model.InsulatedGlass._JSON_FIELDS) | {'__meta__', '__type__'}
+    assert '_t_actual' not in d
+    assert d['_t_nom'] == 30
+    assert [l['__type__'] for l in d['_layers']] == ['MonoGlass', 'GasLayer', 'LaminatedGlass']
+
+    mono, gas, lam = d['_layers']
+    assert (mono['descriptor'], mono['_t_nom'], mono['_t_actual']) == ('A', 6, 6)
+    assert (mono['igdbcode'], mono['_width']) == ('20', 3000)
+    assert (gas['descriptor'], gas['_t_nom']) == ('AIR', 12)
+    assert '_width' not in gas
+    assert lam['_t_nom'] == 12 and '_t_actual' not in lam
+    assert [l['__type__'] for l in lam['_layers']] == ['MonoGlass', 'Interlayer', 'MonoGlass']
+    assert lam['_layers'][1]['_t_actual'] == 0.76
+
+    # encoding neither mutates the buildup nor depends on what was read first
+    assert {name: getattr(igu, name) for name in igu._ALL_SLOTS} == before
+    assert igu.t_actual == pytest.approx(30.76)
+    assert json.loads(json.dumps(igu, cls=glass_model.GlassJsonEncoder)) == d
+
+
+def test_parse_many_matches_make_glass():
+    gstrs = [IGU_GSTR, '6A', '6A&0.76PVB&6A', '#1(6A)_12AIR_#2x(6A)-W1H2', '10T'] * 3
+    buildups = glass_model.parse_many(gstrs, workers=2)
+    assert [b.to_gstr() for b in buildups] == [GlassBuildup.make_glass(g).to_gstr() for g in gstrs]
+    assert [GlassBuildup.make_glass(b.to_gstr()).to_gstr() for b in buildups] == [b.to_gstr() for b in buildups]
+
+
+def test_parse_many_empty():
+    assert glass_model.parse_many([]) == []
+
+
+@pytest.mark.parametrize('cls, separator, t_nom', [
+    (glass_model.LaminatedGlass, lambda: glass_model.Interlayer('PVB', 1), 14),
+    (glass_model.InsulatedGlass, lambda: glass_model.GasLayer('AIR', 12), 26),
+])
+def test_multi_layer_layer_counts(cls, separator, t_nom):
+    with pytest.raises(glass_model.errors.BuildupException):
+        cls([], [separator()])
+    with pytest.raises(glass_model.errors.BuildupException):
+        cls([glass_model.MonoGlass('A', 6)], [separator()])
+
+    assert cls([], []).to_gstr() == ''
+    # any iterable of layers
+    buildup = cls((glass_model.MonoGlass('A', t) for t in (6, 8)), iter([separator()]))
+    assert buildup.t_nom == t_nom
+
+
+def test_base_layer_clone_and_weakref():
+    layer = glass_model._BaseLayer('x', 1)
+    clone = layer._clone()
+    assert (clone.descriptor, clone.t_nom) == ('x', 1) and clone is not layer
+
+    igu = GlassBuildup.make_glass(IGU_GSTR)
+    ref = weakref.ref(igu)
+    assert ref() is igu
+    assert igu._clone().to_gstr() == IGU_GSTR
+
+
+def test_leaf_to_gstr_follows_reassigned_fields():
+    layer = glass_model.Interlayer('PVB', 0.76)
+    assert layer.to_gstr() == '0.76PVB'
+    layer.descriptor = 'SG'
+    assert layer.to_gstr() == '0.76SG'
+    layer._t_nom = 1.52
+    assert layer.to_gstr() == '1.52SG'
+
+    mono = GlassBuildup.make_glass('6A')
+    assert mono.to_gstr() == '6A'
+    # equal, but not the same, thickness is still rebuilt
+    mono._t_nom = 6.0
+    assert mono.to_gstr() == '6.0A'
+    mono.descriptor = 'T'
+    assert mono.to_gstr() == '6.0T'